@@ -68,8 +68,9 @@ apply_manifest() {
     local output
     local exit_code
     
-    output=$("${cmd[@]}" 2>&1)
-    exit_code=$?
+    # Don't let errexit abort before the output is shown
+    exit_code=0
+    output=$("${cmd[@]}" 2>&1) || exit_code=$?
     
     # Always show the output
     echo "$output"
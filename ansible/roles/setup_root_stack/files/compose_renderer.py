@@ -6,31 +6,48 @@ import json
 import argparse
 from pathlib import Path
 
-def add_labels_to_compose(compose_data, labels):
+# Prefer the libyaml-backed loader/dumper, fall back to pure Python
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+def merge_labels(config, labels):
+    """Merge labels into a service/network/volume config and return its labels dict"""
+    config_labels = config.setdefault('labels', {})
+    config_labels.update(labels)
+    return config_labels
+
+def add_labels_to_compose(compose_data, labels, instance_short_id, fqdn):
     """Add labels to all services, networks, and volumes in compose data"""
     
+    # Traefik labels shared by every exposed service of this instance
+    router_prefix = f'traefik.http.routers.${instance_short_id}'
+    service_prefix = f'traefik.http.services.${instance_short_id}'
+    traefik_labels = {
+        f'{router_prefix}.rule': f'Host(`{fqdn}`)',
+        f'{router_prefix}.entrypoints': 'websecure',
+        f'{router_prefix}.tls': 'true',
+        'traefik.docker.network': 'edge_rp',
+    }
+    traefik_port_label = f'{service_prefix}.loadbalancer.server.port'
+    
     # Add labels to services
     if 'services' in compose_data:
         for service_name, service_config in compose_data['services'].items():
-            if 'labels' not in service_config:
-                service_config['labels'] = {}
-            elif isinstance(service_config['labels'], list):
+            if isinstance(service_config.get('labels'), list):
                 # Convert list format to dict format
-                label_dict = {}
-                for label in service_config['labels']:
-                    if '=' in label:
-                        key, value = label.split('=', 1)
-                        label_dict[key] = value
-                service_config['labels'] = label_dict
+                service_config['labels'] = {
+                    key: value
+                    for key, sep, value in (label.partition('=') for label in service_config['labels'])
+                    if sep
+                }
             
-            service_config['labels'].update(labels)
+            service_labels = merge_labels(service_config, labels)
             
-            if service_config['labels'].get('traefik.enable', 'false') == 'true':
-                service_config['labels'][f'traefik.http.routers.${instance_short_id}.rule'] = f'Host(`{fqdn}`)'
-                service_config['labels'][f'traefik.http.routers.${instance_short_id}.entrypoints'] = 'websecure'
-                service_config['labels'][f'traefik.http.routers.${instance_short_id}.tls'] = 'true'
-                service_config['labels'][f'traefik.http.services.${instance_short_id}.loadbalancer.server.port'] = service_config['labels'].get('traefik.port', '80')
-                service_config['labels']['traefik.docker.network'] = 'edge_rp'
+            if service_labels.get('traefik.enable', 'false') == 'true':
+                service_labels.update(traefik_labels)
+                service_labels[traefik_port_label] = service_labels.get('traefik.port', '80')
     
     # Add labels to networks
     if 'networks' in compose_data:
@@ -38,9 +55,7 @@ def add_labels_to_compose(compose_data, labels):
             if network_config is None:
                 network_config = {}
                 compose_data['networks'][network_name] = network_config
-            if 'labels' not in network_config:
-                network_config['labels'] = {}
-            network_config['labels'].update(labels)
+            merge_labels(network_config, labels)
     
     # Add labels to volumes
     if 'volumes' in compose_data:
@@ -48,9 +63,7 @@ def add_labels_to_compose(compose_data, labels):
             if volume_config is None:
                 volume_config = {}
                 compose_data['volumes'][volume_name] = volume_config
-            if 'labels' not in volume_config:
-                volume_config['labels'] = {}
-            volume_config['labels'].update(labels)
+            merge_labels(volume_config, labels)
     
     return compose_data
 
@@ -58,31 +71,32 @@ def main():
     parser = argparse.ArgumentParser(description='Add labels to Docker Compose files')
     parser.add_argument('output_file', help='Output file path for the rendered compose file')
     parser.add_argument('--labels', help='JSON string containing labels to add', default='{}')
-    parser.add_argument('--input', '-i', help='Input compose file (default: stdin)', type=argparse.FileType('r'), default=sys.stdin)
+    parser.add_argument('--input', '-i', help='Input compose file (default: stdin)', type=argparse.FileType('rb'), default=sys.stdin.buffer)
     parser.add_argument('--instance-id', help='Instance ID to use in labels', required=True)
     parser.add_argument('--instance-short-id', help='Instance short ID to use in labels', required=True)
     parser.add_argument('--instance-ref', help='Instance reference to use in labels', required=True)
     parser.add_argument('--fqdn', help='Fully Qualified Domain Name to use in labels', required=True)
     parser.add_argument('--app-id', help='App ID to use in labels', required=True)
     parser.add_argument('--app-short-id', help='App short ID to use in labels', required=True)
+    parser.add_argument('--format', help='Output format (default: yaml)', choices=['yaml', 'json'], default='yaml')
 
     args = parser.parse_args()
     
     # Parse labels from JSON
     labels = json.loads(args.labels)
     
-    # Read compose data from input
-    compose_data = yaml.safe_load(args.input)
+    # Read compose data from input (bytes, decoded by the YAML reader)
+    compose_data = yaml.load(args.input, Loader=SafeLoader)
     
     # Add labels
-    labeled_compose = add_labels_to_compose(compose_data, labels)
+    labeled_compose = add_labels_to_compose(compose_data, labels, args.instance_short_id, args.fqdn)
     
     # Write to output file
     with open(args.output_file, 'w') as f:
         if args.format == 'json':
-            json.dump(labeled_compose, f, indent=2)
+            f.write(json.dumps(labeled_compose, indent=2))
         else:
-            yaml.dump(labeled_compose, f, default_flow_style=False, sort_keys=False)
+            yaml.dump(labeled_compose, f, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
 
 if __name__ == "__main__":
     main()
@@ -91,9 +105,9 @@ if __name__ == "__main__":
 
 
 # Todo :
-- Auto rename networks
-   edge_rp => zz_edge_rp
-   XX_name => XX_INSTANCE_SHORT_ID_name
-- Replace "__INSTANCE_SHORT_ID__" in interface name
-- Inject labels everywhere
-- Add netpol labels in networks
\ No newline at end of file
+# - Auto rename networks
+#    edge_rp => zz_edge_rp
+#    XX_name => XX_INSTANCE_SHORT_ID_name
+# - Replace "__INSTANCE_SHORT_ID__" in interface name
+# - Inject labels everywhere
+# - Add netpol labels in networks
\ No newline at end of file
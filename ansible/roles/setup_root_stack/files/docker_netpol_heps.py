@@ -6,44 +6,117 @@ This script discovers Docker networks with netpol.* labels, generates
 Calico HostEndpoint manifests for them, and applies them using calicoctl.
 """
 
+import hashlib
 import json
+import os
 import subprocess
 import sys
 import tempfile
-import yaml
-from typing import List, Dict, Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+
+# Fields shared by every generated HostEndpoint manifest
+_HEP_TEMPLATE = {
+    'apiVersion': 'projectcalico.org/v3',
+    'kind': 'HostEndpoint'
+}
+
+# Inspect fields used to build manifests; the only ones kept in the cache
+NETWORK_FIELDS = ('Name', 'Labels', 'Options')
+
+CACHE_FILENAME = 'netpol_heps_cache.json'
 
 
 def run_command(cmd: List[str]) -> str:
-    """Run a command and return its output."""
+    """Run a command and return its raw output (stderr goes to the terminal)."""
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        return result.stdout.strip()
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True)
+        return result.stdout
     except subprocess.CalledProcessError as e:
         print(f"Error running command {' '.join(cmd)}: {e}", file=sys.stderr)
         sys.exit(1)
 
 
-def get_docker_networks() -> List[Dict[str, Any]]:
+def get_cache_dir() -> Optional[str]:
+    """Return the private runtime directory of the current user, if any."""
+    uid = os.getuid()
+    cache_dir = '/run' if uid == 0 else f"/run/user/{uid}"
+    try:
+        st = os.stat(cache_dir)
+    except OSError:
+        return None
+    # Refuse directories that other users own or can write to
+    if st.st_uid != uid or st.st_mode & 0o022:
+        return None
+    return cache_dir
+
+
+def load_cached_networks(cache_dir: str, cache_key: str, cache_ttl: int) -> Optional[List[Dict[str, Any]]]:
+    """Return cached networks for the given key if the cache is fresh enough."""
+    try:
+        fd = os.open(os.path.join(cache_dir, CACHE_FILENAME), os.O_RDONLY | os.O_NOFOLLOW)
+        with os.fdopen(fd) as f:
+            st = os.fstat(f.fileno())
+            if st.st_uid != os.getuid() or time.time() - st.st_mtime > cache_ttl:
+                return None
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    # Anything unexpected in the file is a cache miss
+    if not isinstance(cache, dict) or cache.get('key') != cache_key:
+        return None
+    networks = cache.get('networks')
+    if not isinstance(networks, list) or not all(isinstance(network, dict) for network in networks):
+        return None
+    return networks
+
+
+def save_cached_networks(cache_dir: str, cache_key: str, networks: List[Dict[str, Any]]) -> None:
+    """Store inspected networks in the cache file (best effort)."""
+    tmp_file = None
+    try:
+        # mkstemp creates the file with mode 0600 under an unpredictable name
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir, prefix=f".{CACHE_FILENAME}.")
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps({'key': cache_key, 'networks': networks}))
+        os.replace(tmp_file, os.path.join(cache_dir, CACHE_FILENAME))
+    except OSError as e:
+        print(f"Warning: could not write cache in {cache_dir}: {e}", file=sys.stderr)
+        if tmp_file and os.path.exists(tmp_file):
+            os.unlink(tmp_file)
+
+
+def get_docker_networks(cache_ttl: int = 0) -> List[Dict[str, Any]]:
     """Get all Docker networks and return those with netpol labels."""
-    # Get all network IDs
-    network_ids = run_command(['docker', 'network', 'ls', '--format', '{{.ID}}'])
-    if not network_ids:
+    # Get IDs of networks with netpol labels, filtered by the daemon
+    ids = run_command(['docker', 'network', 'ls', '--filter', 'label=netpol.app', '--format', '{{.ID}}']).split()
+    if not ids:
         return []
     
+    # Networks can't be relabeled once created, so the same set of IDs
+    # means the same inspect data
+    # Only cache in a private runtime directory, never in a shared temp dir
+    cache_dir = get_cache_dir() if cache_ttl > 0 else None
+    cache_key = hashlib.blake2b(' '.join(sorted(ids)).encode()).hexdigest()
+    if cache_dir:
+        networks = load_cached_networks(cache_dir, cache_key, cache_ttl)
+        if networks is not None:
+            return networks
+    
+    # Inspect all networks in a single call, one JSON object per line
+    inspect_output = run_command(['docker', 'network', 'inspect', '--format', '{{json .}}', *ids])
+    
+    # Double-check the netpol labels in case the filter was not applied
     networks = []
-    for net_id in network_ids.split('\n'):
-        if not net_id:
-            continue
-            
-        # Inspect each network
-        inspect_output = run_command(['docker', 'network', 'inspect', net_id])
-        network_data = json.loads(inspect_output)[0]
-        
-        # Check if network has netpol labels
-        labels = network_data.get('Labels', {})
-        if labels and 'netpol.app' in labels:
-            networks.append(network_data)
+    for line in inspect_output.splitlines():
+        network_data = json.loads(line)
+        if 'netpol.app' in (network_data.get('Labels') or {}):
+            networks.append({key: network_data[key] for key in NETWORK_FIELDS if key in network_data})
+    
+    if cache_dir:
+        save_cached_networks(cache_dir, cache_key, networks)
     
     return networks
 
@@ -63,22 +136,19 @@ def generate_hep_manifest(network: Dict[str, Any], node_name: str) -> Dict[str,
     app_id = labels.get('netpol.app_id', 'unknown')
     role_name = labels.get('netpol.role', 'unknown')
     
-    hep_manifest = {
-        'apiVersion': 'projectcalico.org/v3',
-        'kind': 'HostEndpoint',
-        'metadata': {
-            'name': bridge_name,
-            'labels': {
-                'app': app_name,
-                'app-id': app_id,
-                'role': role_name
-            }
-        },
-        'spec': {
-            'node': node_name,
-            'interfaceName': bridge_name
+    hep_manifest = _HEP_TEMPLATE.copy()
+    hep_manifest['metadata'] = {
+        'name': bridge_name,
+        'labels': {
+            'app': app_name,
+            'app-id': app_id,
+            'role': role_name
         }
     }
+    hep_manifest['spec'] = {
+        'node': node_name,
+        'interfaceName': bridge_name
+    }
     
     return {
         'manifest': hep_manifest,
@@ -89,11 +159,11 @@ def generate_hep_manifest(network: Dict[str, Any], node_name: str) -> Dict[str,
     }
 
 
-def apply_hep_manifest(manifest: Dict[str, Any], dry_run: bool = False) -> bool:
-    """Apply a HostEndpoint manifest using the apply_calico_manifests.sh helper."""
+def apply_manifests(manifests: List[Dict[str, Any]], dry_run: bool = False) -> bool:
+    """Apply manifests in a single apply_calico_manifests.sh call."""
     try:
-        # Convert manifest to YAML string
-        manifest_yaml = yaml.dump(manifest, default_flow_style=False)
+        # JSON is valid YAML: send one JSON document per manifest
+        manifests_payload = '\n---\n'.join(json.dumps(manifest) for manifest in manifests)
         
         # Use the helper script
         cmd = ['/usr/local/bin/apply_calico_manifests.sh']
@@ -105,7 +175,7 @@ def apply_hep_manifest(manifest: Dict[str, Any], dry_run: bool = False) -> bool:
         
         result = subprocess.run(
             cmd, 
-            input=manifest_yaml, 
+            input=manifests_payload, 
             capture_output=True, 
             text=True, 
             check=True
@@ -114,13 +184,37 @@ def apply_hep_manifest(manifest: Dict[str, Any], dry_run: bool = False) -> bool:
         return True
         
     except subprocess.CalledProcessError as e:
-        print(f"Error applying manifest: {e.stderr}", file=sys.stderr)
+        print(f"Error applying manifests: {e.stdout}{e.stderr}", file=sys.stderr)
         return False
     except Exception as e:
-        print(f"Unexpected error applying manifest: {e}", file=sys.stderr)
+        print(f"Unexpected error applying manifests: {e}", file=sys.stderr)
         return False
 
 
+def apply_hep_manifests(manifests: List[Dict[str, Any]], dry_run: bool = False) -> List[bool]:
+    """
+    Apply HostEndpoint manifests and return whether each one was applied.
+    
+    All manifests are sent in one batch. If the batch fails, each manifest
+    is applied on its own so that one bad manifest doesn't fail the others.
+    """
+    if apply_manifests(manifests, dry_run):
+        return [True] * len(manifests)
+    
+    if len(manifests) > 1:
+        print("Batch apply failed, applying HostEndpoints one by one", file=sys.stderr)
+        return [apply_manifests([manifest], dry_run) for manifest in manifests]
+    
+    return [False]
+
+
+def write_hep_manifest(output_file: str, manifest: Dict[str, Any]) -> str:
+    """Write a HostEndpoint manifest to a YAML file and return its path."""
+    with open(output_file, 'w') as f:
+        yaml.dump(manifest, f, Dumper=SafeDumper, default_flow_style=False)
+    return output_file
+
+
 def main():
     """Main function."""
     import argparse
@@ -130,11 +224,13 @@ def main():
     parser.add_argument('--apply', action='store_true', help='Apply the HostEndpoints to Calico')
     parser.add_argument('--dry-run', action='store_true', help='Perform a dry run (with --apply)')
     parser.add_argument('--output-dir', help='Directory to write YAML files (optional)')
+    parser.add_argument('--cache-ttl', type=int, default=300,
+                        help='Seconds to reuse cached docker network data (0 disables the cache)')
     
     args = parser.parse_args()
     
     # Get networks with netpol labels
-    networks = get_docker_networks()
+    networks = get_docker_networks(args.cache_ttl)
     
     if not networks:
         if args.apply:
@@ -156,27 +252,48 @@ def main():
             
         heps.append(hep_data)
         
-        # Write to file if output directory specified
-        if args.output_dir:
-            import os
-            os.makedirs(args.output_dir, exist_ok=True)
-            output_file = os.path.join(args.output_dir, hep_data['filename'])
-            with open(output_file, 'w') as f:
-                yaml.dump(hep_data['manifest'], f, default_flow_style=False)
-            print(f"Written: {output_file}")
-        
-        # Apply if requested
         if args.apply:
-            print(f"Applying HostEndpoint for network {network['Name']} -> {hep_data['bridge_name']}")
-            if apply_hep_manifest(hep_data['manifest'], args.dry_run):
-                applied_count += 1
-                if not args.dry_run:
-                    print(f"✓ Applied HostEndpoint {hep_data['manifest']['metadata']['name']}")
-                else:
-                    print(f"✓ Dry-run successful for HostEndpoint {hep_data['manifest']['metadata']['name']}")
-            else:
-                failed_count += 1
+            print(f"Applying HostEndpoint for network {hep_data['network_name']} -> {hep_data['bridge_name']}")
+    
+    # Write to files if output directory specified
+    if args.output_dir:
+        # Only --output-dir needs YAML: import it here, as the module globals
+        # write_hep_manifest() uses, to keep it off the JSON-only paths
+        global yaml, SafeDumper
+        import yaml
+        try:
+            from yaml import CSafeDumper as SafeDumper
+        except ImportError:
+            from yaml import SafeDumper
+        
+        os.makedirs(args.output_dir, exist_ok=True)
+        
+        # Filenames don't include the app ID: one writer per path, last one wins
+        manifests_by_file = {}
+        for hep_data in heps:
+            manifests_by_file[os.path.join(args.output_dir, hep_data['filename'])] = hep_data['manifest']
+        
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for output_file in executor.map(
+                write_hep_manifest,
+                manifests_by_file.keys(),
+                manifests_by_file.values()
+            ):
+                print(f"Written: {output_file}")
+    
+    # Apply all manifests at once if requested
+    if args.apply and heps:
+        results = apply_hep_manifests([hep_data['manifest'] for hep_data in heps], args.dry_run)
+        applied_count = results.count(True)
+        failed_count = results.count(False)
+        
+        for hep_data, applied in zip(heps, results):
+            if not applied:
                 print(f"✗ Failed to apply HostEndpoint {hep_data['manifest']['metadata']['name']}")
+            elif not args.dry_run:
+                print(f"✓ Applied HostEndpoint {hep_data['manifest']['metadata']['name']}")
+            else:
+                print(f"✓ Dry-run successful for HostEndpoint {hep_data['manifest']['metadata']['name']}")
     
     # Output results
     if args.apply: